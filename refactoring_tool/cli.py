@@ -3,12 +3,15 @@ import argparse
 import os
 import ast
 import difflib
+import functools
 import logging
-from typing import Tuple, List
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator, Tuple, List
 
-import astor
-
-from refactoring_tool.code_parser import read_python_file, generate_ast, analyze_file
+from refactoring_tool.code_parser import (
+    read_python_file, decode_python_source, generate_ast, load_or_generate_ast,
+    prune_ast_cache, analyze_tree
+)
 from refactoring_tool.refactoring_engine import RefactoringEngine
 
 # Imports the ML error filter
@@ -18,8 +21,35 @@ try:
 except ImportError:
     ML_AVAILABLE = False
 
+# Converts ASTs back to source with the built-in unparser when available
+if hasattr(ast, 'unparse'):
+    def to_source(tree: ast.AST) -> str:
+        """
+        Converts an AST back to source code, ending with a newline.
+
+        :param tree: The AST to convert.
+        :type tree: ast.AST
+        :return: The generated source code.
+        :rtype: str
+        """
+        return ast.unparse(tree) + '\n'
+else:
+    from astor import to_source
+
 logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
 
+# Suffix of the files processed when walking a directory
+PY_SUFFIX = '.py'
+
+# Buffer size used when writing output files
+WRITE_BUFFER_SIZE = 128 * 1024
+
+# The engine holds no per-file state, so one instance serves every file
+_ENGINE = RefactoringEngine()
+
+# ML error filter used by the current worker process, set by _init_worker
+_worker_ml_filter = None
+
 
 def main():
     """
@@ -32,12 +62,19 @@ def main():
     parser.add_argument('-v', '--verbose', action='store_true', help='Enable verbose output')
     parser.add_argument('--use-ml-filter', action='store_true',
                         help='Use the ML model to filter out risky refactorings if available')
+    parser.add_argument('-j', '--jobs', type=positive_int, default=None,
+                        help='Number of worker processes used for directories (default: number of CPUs)')
+    parser.add_argument('--cache-dir', default=None,
+                        help='Directory in which parsed files are cached between runs, '
+                             'e.g. ~/.cache/refactor_tool (default: no caching)')
     args = parser.parse_args()
 
     input_path = args.input_path
     output_dir = args.output
     verbose = args.verbose
     use_ml_filter = args.use_ml_filter
+    jobs = args.jobs
+    cache_dir = os.path.expanduser(args.cache_dir) if args.cache_dir else None
 
     if verbose:
         logging.getLogger().setLevel(logging.DEBUG)
@@ -60,19 +97,38 @@ def main():
 
     # Processes input path
     if os.path.isfile(input_path):
-        process_file(input_path, output_dir, verbose, ml_filter)
+        process_file(input_path, output_dir, verbose, ml_filter, cache_dir)
     elif os.path.isdir(input_path):
-        for root, _, files in os.walk(input_path):
-            for file in files:
-                if file.endswith('.py'):
-                    file_path = os.path.join(root, file)
-                    process_file(file_path, output_dir, verbose, ml_filter)
+        process_files(iter_py_files(input_path), output_dir, verbose, ml_filter, jobs, cache_dir)
     else:
         print(f"The path {input_path} is not a valid file or directory.")
         sys.exit(1)
 
+    if cache_dir is not None:
+        prune_ast_cache(cache_dir)
+
+
+def positive_int(value: str) -> int:
+    """
+    Parses a command-line value as an integer of at least 1.
+
+    :param value: The value given on the command line.
+    :type value: str
+    :return: The parsed integer.
+    :rtype: int
+    :raises argparse.ArgumentTypeError: If the value is not an integer of at least 1.
+    """
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid int value: '{value}'")
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+    return number
 
-def process_file(file_path: str, output_dir: str, verbose: bool, ml_filter: 'MLErrorFilter' = None):
+
+def process_file(file_path: str, output_dir: str, verbose: bool, ml_filter: 'MLErrorFilter' = None,
+                 cache_dir: str = None):
     """
     Processes a single Python file:
     - Analyzes for refactoring opportunities.
@@ -82,6 +138,9 @@ def process_file(file_path: str, output_dir: str, verbose: bool, ml_filter: 'MLE
     - Writes the refactored file to the output directory if accepted,
       otherwise writes the original file.
 
+    Messages about the file are collected and written to stdout in a single
+    call once it is done.
+
     :param file_path: Path to the Python file to be processed.
     :type file_path: str
     :param output_dir: Directory where refactored code will be written.
@@ -90,97 +149,232 @@ def process_file(file_path: str, output_dir: str, verbose: bool, ml_filter: 'MLE
     :type verbose: bool
     :param ml_filter: Instance of MLErrorFilter or None if unused.
     :type ml_filter: MLErrorFilter or None
+    :param cache_dir: Directory of the on-disk AST cache, or None to always parse.
+    :type cache_dir: str or None
+    """
+    out = []
+    _process_file(file_path, output_dir, verbose, ml_filter, cache_dir, out)
+    if out:
+        sys.stdout.write(''.join(out))
+
+
+def _process_file(file_path: str, output_dir: str, verbose: bool, ml_filter: 'MLErrorFilter',
+                  cache_dir: str, out: List[str]):
+    """
+    Processes a single Python file as described in process_file.
+
+    Messages are appended to out instead of being printed, so that callers can
+    write the output of a whole file at once.
+
+    :param out: List collecting the messages for the file.
+    :type out: List[str]
     """
-    loop_issues, nested_if_issues, if_chain_issues = analyze_file(file_path)
+    original_code = None
+    try:
+        original_code = read_python_file(file_path)
+        if cache_dir is None:
+            tree = generate_ast(original_code)
+        else:
+            tree = load_or_generate_ast(original_code, cache_dir)
+    except Exception as e:
+        out.append(f"Error processing {file_path}: {e}\n")
+        write_original_file(file_path, output_dir, original_code)
+        return
+
+    loop_issues, nested_if_issues, if_chain_issues = analyze_tree(tree)
     total_issues = len(loop_issues) + len(nested_if_issues) + len(if_chain_issues)
 
     if total_issues == 0:
         if verbose:
-            print(f"No issues found in {file_path}.")
+            out.append(f"No issues found in {file_path}.\n")
         # Writes the original file to output directory for consistency
-        write_original_file(file_path, output_dir)
+        write_original_file(file_path, output_dir, original_code)
         return
 
     if verbose:
-        print(f"Issues in {file_path}:")
+        out.append(f"Issues in {file_path}:\n")
         for issue in loop_issues:
-            print(f"Line {issue['line']}: {issue['message']}")
+            out.append(f"Line {issue.line}: {issue.message}\n")
         for issue in nested_if_issues:
-            print(f"Line {issue['line']}: {issue['message']}")
+            out.append(f"Line {issue.line}: {issue.message}\n")
         for issue in if_chain_issues:
-            print(f"Line {issue['line']}: {issue['message']}")
+            out.append(f"Line {issue.line}: {issue.message}\n")
 
-    refactored_code = apply_refactorings(file_path)
+    # Reuses the tree from the analysis step instead of parsing the file again
+    refactored_code = apply_refactorings(file_path, tree)
     if refactored_code is None:
-        write_original_file(file_path, output_dir)
+        write_original_file(file_path, output_dir, original_code)
         return
 
+    # The source is only decoded when it is compared as text
+    original_text = None
+    if ml_filter is not None or verbose:
+        original_text = decode_python_source(original_code)
+
     # If ML filter is available, checks error probability
     if ml_filter is not None:
-        original_code = read_python_file(file_path)
-        error_probability = ml_filter.predict_refactoring_error(original_code, refactored_code)
+        error_probability = ml_filter.predict_refactoring_error(original_text, refactored_code)
         error_threshold = 0.3  # this threshold can be adjusted as needed
 
         if error_probability > error_threshold:
             logging.warning(f"Refactoring on {file_path} deemed risky (prob={error_probability:.2f}). Skipping.")
-            write_original_file(file_path, output_dir)
+            write_original_file(file_path, output_dir, original_code)
             return
         else:
             logging.debug(f"Refactoring on {file_path} accepted (prob={error_probability:.2f}).")
 
-    # Generates diff
-    original_code_lines = read_python_file(file_path).splitlines(keepends=True)
-    refactored_lines = refactored_code.splitlines(keepends=True)
-    diff = difflib.unified_diff(
-        original_code_lines,
-        refactored_lines,
-        fromfile=file_path,
-        tofile=os.path.join(output_dir, os.path.basename(file_path))
-    )
-    diff_text = ''.join(diff)
-
-    if diff_text.strip() and verbose:
-        print("Refactoring Diff:")
-        print(diff_text)
+    # Generates diff, only when it is printed and there is something to show
+    if verbose and refactored_code != original_text:
+        original_code_lines = original_text.splitlines(keepends=True)
+        refactored_lines = refactored_code.splitlines(keepends=True)
+        diff = difflib.unified_diff(
+            original_code_lines,
+            refactored_lines,
+            fromfile=file_path,
+            tofile=os.path.join(output_dir, os.path.basename(file_path))
+        )
+        diff_text = ''.join(diff)
+
+        if diff_text.strip():
+            out.append("Refactoring Diff:\n")
+            out.append(f"{diff_text}\n")
 
     # Writes the refactored code to the output directory
     write_refactored_file(file_path, output_dir, refactored_code)
 
 
-def apply_refactorings(file_path: str) -> str:
+def iter_py_files(root: str) -> Iterator[str]:
+    """
+    Lazily yields the paths of all Python files below a directory.
+
+    Uses os.scandir, whose entries cache the file type and already hold the
+    joined path, so no extra stat or path joining is needed per entry.
+    Directories are visited from an explicit stack rather than recursively,
+    so paths are not passed up through one generator per directory level.
+    Symbolic links to directories are not followed and unreadable
+    directories are skipped, as with os.walk.
+
+    :param root: Directory to search.
+    :type root: str
+    :return: Iterator over the paths of the .py files found.
+    :rtype: Iterator[str]
+    """
+    suffix = PY_SUFFIX
+    pending_dirs = [root]
+    while pending_dirs:
+        try:
+            with os.scandir(pending_dirs.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        pending_dirs.append(entry.path)
+                    elif entry.name.endswith(suffix) and entry.is_file():
+                        yield entry.path
+        except OSError:
+            continue
+
+
+def process_files(file_paths: Iterable[str], output_dir: str, verbose: bool,
+                  ml_filter: 'MLErrorFilter' = None, jobs: int = None, cache_dir: str = None):
+    """
+    Processes several Python files, spreading them across worker processes.
+
+    Each file is parsed and transformed independently, so the work is CPU-bound
+    and scales with the number of processes. The ML filter, including its loaded
+    model, is sent to each worker once when the pool starts rather than with
+    every file.
+
+    :param file_paths: Paths to the Python files to be processed.
+    :type file_paths: Iterable[str]
+    :param output_dir: Directory where refactored code will be written.
+    :type output_dir: str
+    :param verbose: Flag indicating verbosity of output.
+    :type verbose: bool
+    :param ml_filter: Instance of MLErrorFilter or None if unused.
+    :type ml_filter: MLErrorFilter or None
+    :param jobs: Number of worker processes, defaults to the number of CPUs.
+        A value of 1 processes the files sequentially in the current process.
+    :type jobs: int or None
+    :param cache_dir: Directory of the on-disk AST cache, or None to always parse.
+    :type cache_dir: str or None
+    """
+    if jobs == 1:
+        for file_path in file_paths:
+            process_file(file_path, output_dir, verbose, ml_filter, cache_dir)
+        return
+
+    worker = functools.partial(_process_file_in_worker, output_dir=output_dir, verbose=verbose,
+                               cache_dir=cache_dir)
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker,
+                             initargs=(ml_filter,)) as executor:
+        # Workers return their output, written here in file order so that
+        # messages of different files are never interleaved
+        for output in executor.map(worker, file_paths, chunksize=32):
+            if output:
+                sys.stdout.write(output)
+
+
+def _init_worker(ml_filter: 'MLErrorFilter'):
+    """
+    Stores the ML error filter for the lifetime of a worker process.
+
+    :param ml_filter: Instance of MLErrorFilter or None if unused.
+    :type ml_filter: MLErrorFilter or None
+    """
+    global _worker_ml_filter
+    _worker_ml_filter = ml_filter
+
+
+def _process_file_in_worker(file_path: str, output_dir: str, verbose: bool, cache_dir: str = None) -> str:
+    """
+    Processes a single file inside a worker process started by process_files.
+
+    :return: The messages produced for the file.
+    :rtype: str
+    """
+    out = []
+    _process_file(file_path, output_dir, verbose, _worker_ml_filter, cache_dir, out)
+    return ''.join(out)
+
+
+def apply_refactorings(file_path: str, tree: ast.AST = None) -> str:
     """
     Applies refactorings to the given file and returns the refactored code as a string.
 
     Steps:
-    - Parse the file into an AST.
+    - Parse the file into an AST, unless an already-parsed tree is given.
     - Identify nodes that can be refactored (loops, nested ifs, if-elif-else chains).
     - Apply transformations using RefactoringEngine.
-    - Convert AST back to code using astor.to_source().
+    - Convert AST back to code using ast.unparse() (astor on Python < 3.9).
 
     :param file_path: Path to the Python file.
     :type file_path: str
-    :return: Refactored code or None if refactoring fails.
+    :param tree: AST of the file, transformed in place. Parsed from file_path if None.
+    :type tree: ast.AST or None
+    :return: Refactored code, or None if no refactoring applies or it fails.
     :rtype: str or None
     """
-    try:
-        original_code = read_python_file(file_path)
-        tree = generate_ast(original_code)
-    except Exception as e:
-        logging.warning(f"Could not parse {file_path}: {e}")
+    if tree is None:
+        try:
+            original_code = read_python_file(file_path)
+            tree = generate_ast(original_code)
+        except Exception as e:
+            logging.warning(f"Could not parse {file_path}: {e}")
+            return None
+
+    transformed_tree, changed = refactor_ast(tree, _ENGINE)
+    if not changed:
+        # Nothing was transformed, so the original file is already the result
         return None
 
-    engine = RefactoringEngine()
-    transformed_tree = refactor_ast(tree, engine)
-
     try:
-        refactored_code = astor.to_source(transformed_tree)
+        refactored_code = to_source(transformed_tree)
         return refactored_code
     except Exception as e:
         logging.warning(f"Error converting AST back to code for {file_path}: {e}")
         return None
 
 
-def refactor_ast(tree: ast.AST, engine: 'RefactoringEngine') -> ast.AST:
+def refactor_ast(tree: ast.AST, engine: 'RefactoringEngine') -> Tuple[ast.AST, bool]:
     """
     Traverses the AST and applies transformations to detected patterns:
     - For-loops that can be converted to comprehensions.
@@ -191,36 +385,13 @@ def refactor_ast(tree: ast.AST, engine: 'RefactoringEngine') -> ast.AST:
     :type tree: ast.AST
     :param engine: An instance of RefactoringEngine.
     :type engine: RefactoringEngine
-    :return: The transformed AST.
-    :rtype: ast.AST
-    """
-    class RefactoringVisitor(ast.NodeTransformer):
-        def visit_For(self, node: ast.For) -> ast.AST:
-            node = self.generic_visit(node)
-            return engine.refactor_loop(node)
-
-        def visit_If(self, node: ast.If) -> ast.AST:
-            node = self.generic_visit(node)
-            node = engine.refactor_nested_if(node) if isinstance(node, ast.If) else node
-            if isinstance(node, ast.If):
-                result = engine.refactor_if_chain(node)
-                if len(result) == 1 and isinstance(result[0], ast.If):
-                    return result[0]
-                elif len(result) == 2:
-                    # If chain was successfully transformed into two statements
-                    # We'll keep the original node if we can't properly insert two statements in place.
-                    return node
-                else:
-                    return node
-            return node
-
-    visitor = RefactoringVisitor()
-    transformed_tree = visitor.visit(tree)
-    ast.fix_missing_locations(transformed_tree)
-    return transformed_tree
-
-
-def write_original_file(file_path: str, output_dir: str):
+    :return: The transformed AST, and whether any transformation was applied.
+    :rtype: Tuple[ast.AST, bool]
+    """
+    return engine.apply(tree)
+
+
+def write_original_file(file_path: str, output_dir: str, code: bytes = None):
     """
     Copies the original file into the output directory without changes.
 
@@ -228,11 +399,13 @@ def write_original_file(file_path: str, output_dir: str):
     :type file_path: str
     :param output_dir: Directory to write the file.
     :type output_dir: str
+    :param code: Content of the original file if already read, otherwise it is read from file_path.
+    :type code: bytes or None
     """
-    code = read_python_file(file_path)
+    if code is None:
+        code = read_python_file(file_path)
     write_path = os.path.join(output_dir, os.path.basename(file_path))
-    with open(write_path, 'w', encoding='utf-8') as f:
-        f.write(code)
+    write_file_atomically(write_path, code)
 
 
 def write_refactored_file(file_path: str, output_dir: str, refactored_code: str):
@@ -247,9 +420,32 @@ def write_refactored_file(file_path: str, output_dir: str, refactored_code: str)
     :type refactored_code: str
     """
     write_path = os.path.join(output_dir, os.path.basename(file_path))
-    with open(write_path, 'w', encoding='utf-8') as f:
-        f.write(refactored_code)
+    write_file_atomically(write_path, refactored_code.encode('utf-8'))
+
+
+def write_file_atomically(write_path: str, data: bytes):
+    """
+    Writes data to a file so that it is either fully written or left untouched.
+
+    The data goes to a temporary file next to the target, which is then renamed
+    over it. The temporary name includes the process id, so worker processes
+    writing files with the same name do not clash.
+
+    :param write_path: Path of the file to write.
+    :type write_path: str
+    :param data: The content to write.
+    :type data: bytes
+    """
+    tmp_path = f"{write_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'wb', buffering=WRITE_BUFFER_SIZE) as f:
+            f.write(data)
+        os.replace(tmp_path, write_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
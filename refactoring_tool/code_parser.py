@@ -1,195 +1,469 @@
+import array
 import ast
-from typing import List, Any, Tuple
+import hashlib
+import importlib.util
+import logging
+import os
+import pickle
+import re
+import sys
+import threading
+from typing import Iterator, List, NamedTuple, Optional, Tuple, Union
 
-def read_python_file(file_path: str) -> str:
+# Issue messages, shared by every issue of a kind
+MSG_FOR_LOOP = sys.intern("For-loop can be converted to a list comprehension.")
+MSG_NESTED_IF = sys.intern("Nested if-statements can be merged.")
+MSG_IF_CHAIN = sys.intern("If-elif-else chain can be replaced with a dictionary.")
+
+# Issue kinds reported by analyze_file_flat
+KIND_FOR_LOOP = 0
+KIND_NESTED_IF = 1
+KIND_IF_CHAIN = 2
+
+# Minimum number of branches for an if-elif-else chain to be reported
+IF_CHAIN_MIN_LENGTH = 3
+
+# Buffer size used when reading source files
+READ_BUFFER_SIZE = 128 * 1024
+
+class Issue(NamedTuple):
+    """
+    A refactoring opportunity found in the code.
+
+    node is only set when the analysis is asked to keep nodes, so that
+    reported issues do not hold on to the analyzed tree by default.
+    """
+    line: int
+    col: int
+    message: str
+    node: Optional[ast.AST] = None
+
+# Default size limit of the on-disk AST cache, in bytes
+AST_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# Size of the code digests naming cached trees, in bytes, and the file names they give
+_AST_CACHE_DIGEST_SIZE = 16
+_AST_CACHE_ENTRY_RE = re.compile(r'[0-9a-f]{%d}' % (2 * _AST_CACHE_DIGEST_SIZE))
+
+# Node fields holding lists of statements, or of except/case clauses that hold
+# statements themselves, in the order they appear in the source
+_STATEMENT_FIELDS = ('body', 'handlers', 'orelse', 'finalbody', 'cases')
+
+# The same fields, last first, for pushing onto the traversal stack
+_STATEMENT_FIELDS_REVERSED = _STATEMENT_FIELDS[::-1]
+
+# Per-thread state, holding the detector reused across analyses
+_thread_state = threading.local()
+
+def read_python_file(file_path: str) -> bytes:
     """
     Reads Python code from a file.
 
+    The file is read in binary mode: the parser decodes the source itself,
+    honoring any PEP 263 encoding declaration. Use decode_python_source
+    when the text is needed.
+
     :param file_path: Path to the Python (.py) file.
-    :return: String containing the Python code.
+    :return: Bytes containing the Python code.
     :raises FileNotFoundError: If the file does not exist.
     :raises IOError: If the file cannot be read.
     """
     try:
-        with open(file_path, 'r', encoding='utf-8') as file:
-            code = file.read()
-        return code
+        with open(file_path, 'rb', buffering=READ_BUFFER_SIZE) as file:
+            return file.read()
     except FileNotFoundError:
         raise FileNotFoundError(f"The file {file_path} does not exist.")
     except IOError as e:
         raise IOError(f"An error occurred while reading the file {file_path}: {e}")
 
-def generate_ast(code: str) -> ast.AST:
+def decode_python_source(code: bytes) -> str:
+    """
+    Decodes Python source bytes into text.
+
+    :param code: Bytes containing Python code.
+    :return: String containing the Python code, with universal newlines.
+    :raises SyntaxError: If the encoding declaration is invalid.
+    :raises UnicodeDecodeError: If the bytes do not match the declared encoding.
+    """
+    return importlib.util.decode_source(code)
+
+def generate_ast(code: Union[bytes, str]) -> ast.AST:
     """
     Generates an Abstract Syntax Tree (AST) from Python code.
 
-    :param code: String containing Python code.
+    :param code: Bytes or string containing Python code.
     :return: AST object representing the code structure.
     :raises SyntaxError: If the code contains syntax errors.
     """
     try:
-        tree = ast.parse(code)
+        tree = compile(code, '<unknown>', 'exec', flags=ast.PyCF_ONLY_AST, dont_inherit=True)
         return tree
     except SyntaxError as e:
         raise SyntaxError(f"Syntax error in code: {e}")
 
-class BaseDetector(ast.NodeVisitor):
+def _ast_cache_version_dir(cache_dir: str) -> str:
     """
-    Base class for AST node visitors for pattern detection.
+    Returns the subdirectory of cache_dir holding the trees of the running interpreter version.
+
+    :param cache_dir: Directory holding the cached trees.
+    :return: Path to the version subdirectory.
     """
+    return os.path.join(cache_dir, sys.implementation.cache_tag)
 
-    def __init__(self):
-        self.issues = []
+def load_or_generate_ast(code: bytes, cache_dir: str) -> ast.AST:
+    """
+    Generates an AST, reusing the tree stored by an earlier run for identical code.
 
-    def report_issue(self, node: ast.AST, message: str):
-        """
-        Records an issue found during AST traversal.
+    Trees are pickled into cache_dir, keyed by a hash of the code, in a
+    subdirectory per interpreter version since AST classes differ between
+    versions. Unreadable cache entries are ignored and regenerated.
 
-        :param node: The AST node where the issue was found.
-        :param message: Description of the issue.
-        """
-        issue = {
-            'line': node.lineno,
-            'col': node.col_offset,
-            'message': message,
-            'node': node
-        }
-        self.issues.append(issue)
+    :param code: Bytes containing Python code.
+    :param cache_dir: Directory holding the cached trees.
+    :return: AST object representing the code structure.
+    :raises SyntaxError: If the code contains syntax errors.
+    """
+    digest = hashlib.blake2b(code, digest_size=_AST_CACHE_DIGEST_SIZE).hexdigest()
+    version_dir = _ast_cache_version_dir(cache_dir)
+    cache_path = os.path.join(version_dir, digest)
+    try:
+        with open(cache_path, 'rb') as file:
+            tree = pickle.load(file)
+    except Exception:
+        # Missing, corrupted or incompatible entries are regenerated below
+        pass
+    else:
+        try:
+            # Marks the entry as recently used for prune_ast_cache
+            os.utime(cache_path)
+        except OSError:
+            # A read-only cache still serves the trees it holds
+            pass
+        return tree
 
-class ForLoopDetector(BaseDetector):
+    tree = generate_ast(code)
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(version_dir, exist_ok=True)
+        with open(tmp_path, 'wb') as file:
+            pickle.dump(tree, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    except Exception as e:
+        # The cache is an optimization only; failing to fill it, e.g. with a
+        # RecursionError on a deeply nested tree, is not an error
+        logging.debug(f"Could not cache the AST in {cache_path}: {e}")
+    finally:
+        try:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        except OSError:
+            pass
+    return tree
+
+def prune_ast_cache(cache_dir: str, max_bytes: int = AST_CACHE_MAX_BYTES):
     """
-    Detects for-loops that can be converted into list comprehensions or generator expressions.
+    Removes the least recently used cached trees until the cache fits in max_bytes.
+
+    Only the trees stored by load_or_generate_ast for the running interpreter
+    version are considered, so other files in cache_dir are never removed.
+
+    :param cache_dir: Directory holding the cached trees.
+    :param max_bytes: Maximum total size of the cached trees.
     """
+    version_dir = _ast_cache_version_dir(cache_dir)
+    try:
+        files = os.listdir(version_dir)
+    except OSError:
+        return
 
-    def visit_For(self, node: ast.For):
-        """
-        Visits all For nodes in the AST.
+    entries = []
+    for file in files:
+        if not _AST_CACHE_ENTRY_RE.fullmatch(file):
+            continue
+        path = os.path.join(version_dir, file)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
 
-        :param node: AST For node.
-        """
-        if self.is_append_loop(node):
-            self.report_issue(
-                node,
-                "For-loop can be converted to a list comprehension."
-            )
-        self.generic_visit(node)
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
 
-    @staticmethod
-    def is_append_loop(node: ast.For) -> bool:
-        """
-        Determines if a for-loop is an append loop.
+def is_append_loop(node: ast.For) -> bool:
+    """
+    Determines if a for-loop is an append loop.
 
-        :param node: AST For node.
-        :return: True if it is an append loop, False otherwise.
-        """
-        # Check if the body has a single expression that appends to a list
-        if len(node.body) != 1:
-            return False
-        stmt = node.body[0]
-        # Handle both Expr and Assign nodes
-        if isinstance(stmt, (ast.Expr, ast.Assign)):
-            if isinstance(stmt, ast.Assign):
-                # Handle cases like result += [item * 2]
-                return True
-            expr = stmt.value
-            if isinstance(expr, ast.Call):
-                if isinstance(expr.func, ast.Attribute):
-                    if expr.func.attr == 'append':
-                        return True
+    :param node: AST For node.
+    :return: True if it is an append loop, False otherwise.
+    """
+    # Check if the body has a single expression that appends to a list
+    if len(node.body) != 1:
         return False
+    stmt = node.body[0]
+    # Handle both Expr and Assign nodes
+    if isinstance(stmt, (ast.Expr, ast.Assign)):
+        if isinstance(stmt, ast.Assign):
+            # Handle cases like result += [item * 2]
+            return True
+        expr = stmt.value
+        if isinstance(expr, ast.Call):
+            if isinstance(expr.func, ast.Attribute):
+                if expr.func.attr == 'append':
+                    return True
+    return False
+
+def is_nested_if(node: ast.If) -> bool:
+    """
+    Determines if an if-statement contains a nested if-statement that can be merged.
+
+    :param node: AST If node.
+    :return: True if nested if-statements can be merged, False otherwise.
+    """
+    if len(node.body) == 1 and isinstance(node.body[0], ast.If):
+        return True
+    return False
 
-class NestedIfDetector(BaseDetector):
+def get_if_chain_length(node: ast.If, limit: int = None) -> int:
     """
-    Detects nested if-statements that can be merged.
+    Calculates the length of an if-elif-else chain.
+
+    :param node: AST If node.
+    :param limit: Stops counting once the length reaches this value, if given.
+    :return: Length of the if-elif-else chain, capped at limit.
     """
+    length = 1
+    current_node = node.orelse
+    while current_node and length != limit:
+        if len(current_node) == 1 and isinstance(current_node[0], ast.If):
+            length += 1
+            current_node = current_node[0].orelse
+        else:
+            break
+    return length
 
-    def visit_If(self, node: ast.If):
+def iter_nested_if_nodes(node: ast.If) -> Iterator[ast.If]:
+    """
+    Yields the If nodes nested directly inside one another below an if-statement.
+
+    :param node: AST If node at the top of the nesting.
+    :return: Iterator over the nested If nodes, outermost first.
+    """
+    current_node = node
+    while len(current_node.body) == 1 and isinstance(current_node.body[0], ast.If):
+        current_node = current_node.body[0]
+        yield current_node
+
+def iter_elif_nodes(node: ast.If) -> Iterator[ast.If]:
+    """
+    Yields the If nodes representing the elif branches of an if-elif-else chain.
+
+    :param node: AST If node at the head of the chain.
+    :return: Iterator over the elif If nodes, in order.
+    """
+    current_node = node.orelse
+    while len(current_node) == 1 and isinstance(current_node[0], ast.If):
+        yield current_node[0]
+        current_node = current_node[0].orelse
+
+class CombinedDetector:
+    """
+    Detects all supported refactoring opportunities in a single AST traversal.
+
+    Issues are collected into separate lists per pattern:
+    - loop_issues: for-loops that can be converted into list comprehensions.
+    - nested_if_issues: nested if-statements that can be merged.
+    - if_chain_issues: if-elif-else chains that can be replaced with dictionary lookups.
+
+    In flat mode, no Issue is built: the KIND_* code and message of each issue
+    are appended to the kinds array and messages list instead, in source order.
+
+    :param keep_nodes: Whether issues reference the AST node they were found at.
+    :param flat: Whether issues are collected into kinds and messages.
+    """
+
+    def __init__(self, keep_nodes: bool = False, flat: bool = False):
+        self.reset(keep_nodes, flat)
+
+    def reset(self, keep_nodes: bool = False, flat: bool = False):
         """
-        Visits all If nodes in the AST.
+        Clears the collected issues so the detector can analyze another tree.
 
-        :param node: AST If node.
+        Issue lists returned earlier are replaced rather than emptied, so they
+        stay valid for their callers.
+
+        :param keep_nodes: Whether issues reference the AST node they were found at.
+        :param flat: Whether issues are collected into kinds and messages.
         """
-        if self.is_nested_if(node):
-            self.report_issue(
-                node,
-                "Nested if-statements can be merged."
-            )
-        self.generic_visit(node)
+        self.keep_nodes = keep_nodes
+        self.flat = flat
+        self.loop_issues = []
+        self.nested_if_issues = []
+        self.if_chain_issues = []
+        # Issue lists indexed by KIND_* code
+        self._issue_lists = (self.loop_issues, self.nested_if_issues, self.if_chain_issues)
+        self.kinds = array.array('b')
+        self.messages = []
+        # ids of If nodes already covered by a reported nested if or chain
+        self._nested_links = set()
+        self._chain_links = set()
 
-    @staticmethod
-    def is_nested_if(node: ast.If) -> bool:
+    def report_issue(self, kind: int, node: ast.AST, message: str):
         """
-        Determines if an if-statement contains a nested if-statement that can be merged.
+        Records an issue found during AST traversal.
 
-        :param node: AST If node.
-        :return: True if nested if-statements can be merged, False otherwise.
+        :param kind: The KIND_* code of the issue.
+        :param node: The AST node where the issue was found.
+        :param message: Description of the issue.
         """
-        if len(node.body) == 1 and isinstance(node.body[0], ast.If):
-            return True
-        return False
+        if self.flat:
+            self.kinds.append(kind)
+            self.messages.append(message)
+            return
+        issues = self._issue_lists[kind]
+        if self.keep_nodes:
+            issues.append(Issue(node.lineno, node.col_offset, message, node))
+        else:
+            issues.append(Issue(node.lineno, node.col_offset, message))
 
-class IfElseChainDetector(BaseDetector):
-    """
-    Detects if-elif-else chains that can be replaced with dictionary lookups.
-    """
+    def detect(self, tree: ast.AST):
+        """
+        Collects the issues of every pattern found in the AST.
+
+        The tree is walked once, without recursion, in source order. Since
+        For and If are statements and expressions cannot contain statements,
+        only the statement lists of each node are descended into.
 
-    def visit_If(self, node: ast.If):
+        :param tree: The AST to analyze.
         """
-        Visits all If nodes in the AST.
+        stack = [tree]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, ast.For):
+                self.check_for(node)
+            elif isinstance(node, ast.If):
+                self.check_if(node)
+            # Fields and their statements are pushed last first, so they are popped in source order
+            for field in _STATEMENT_FIELDS_REVERSED:
+                children = getattr(node, field, None)
+                if isinstance(children, list):
+                    stack.extend(reversed(children))
 
-        :param node: AST If node.
+    def check_for(self, node: ast.For):
+        """
+        Checks a For node for refactoring opportunities.
+
+        :param node: AST For node.
         """
-        chain_length = self.get_if_chain_length(node)
-        if chain_length >= 3:
+        if is_append_loop(node):
             self.report_issue(
+                KIND_FOR_LOOP,
                 node,
-                "If-elif-else chain can be replaced with a dictionary."
+                MSG_FOR_LOOP
             )
-        self.generic_visit(node)
 
-    def get_if_chain_length(self, node: ast.If) -> int:
+    def check_if(self, node: ast.If):
         """
-        Calculates the length of an if-elif-else chain.
+        Checks an If node for refactoring opportunities.
 
         :param node: AST If node.
-        :return: Length of the if-elif-else chain.
         """
-        length = 1
-        current_node = node.orelse
-        while current_node:
-            if len(current_node) == 1 and isinstance(current_node[0], ast.If):
-                length += 1
-                current_node = current_node[0].orelse
-            else:
-                break
-        return length
-
-def analyze_file(file_path: str) -> Tuple[List[Any], List[Any], List[Any]]:
+        # An If nested in a reported one merges into that same condition
+        if is_nested_if(node) and id(node) not in self._nested_links:
+            self.report_issue(
+                KIND_NESTED_IF,
+                node,
+                MSG_NESTED_IF
+            )
+            self._nested_links.update(id(inner) for inner in iter_nested_if_nodes(node))
+        # An elif branch of a reported chain is only the tail of that chain
+        if id(node) in self._chain_links:
+            return
+        if get_if_chain_length(node, IF_CHAIN_MIN_LENGTH) >= IF_CHAIN_MIN_LENGTH:
+            self.report_issue(
+                KIND_IF_CHAIN,
+                node,
+                MSG_IF_CHAIN
+            )
+            self._chain_links.update(id(link) for link in iter_elif_nodes(node))
+
+def _thread_detector() -> CombinedDetector:
+    """
+    Returns this thread's detector, which walks the AST once for every pattern.
+
+    :return: The detector reused across the analyses of the current thread.
+    """
+    detector = getattr(_thread_state, 'detector', None)
+    if detector is None:
+        detector = _thread_state.detector = CombinedDetector()
+    return detector
+
+def analyze_tree(tree: ast.AST, keep_nodes: bool = False) -> Tuple[List[Issue], List[Issue], List[Issue]]:
+    """
+    Analyzes an already-parsed AST for specific refactoring opportunities.
+
+    :param tree: AST of the code to analyze.
+    :param keep_nodes: Whether issues reference the AST node they were found at,
+        e.g. to pass them on to the RefactoringEngine.
+    :return: Tuple containing lists of loop, nested-if and if-chain issues.
+    """
+    detector = _thread_detector()
+    detector.reset(keep_nodes)
+    detector.detect(tree)
+
+    return (
+        detector.loop_issues,
+        detector.nested_if_issues,
+        detector.if_chain_issues
+    )
+
+def analyze_source(code: Union[bytes, str], keep_nodes: bool = False) -> Tuple[List[Issue], List[Issue], List[Issue]]:
+    """
+    Analyzes Python source code for specific refactoring opportunities.
+
+    :param code: Bytes or string containing Python code.
+    :param keep_nodes: Whether issues reference the AST node they were found at.
+    :return: Tuple containing lists of loop, nested-if and if-chain issues.
+    :raises SyntaxError: If the code contains syntax errors.
+    """
+    tree = generate_ast(code)
+    return analyze_tree(tree, keep_nodes)
+
+def analyze_file(file_path: str, keep_nodes: bool = False) -> Tuple[List[Issue], List[Issue], List[Issue]]:
     """
     Analyzes a Python file for specific refactoring opportunities.
 
     :param file_path: Path to the Python file.
-    :return: Tuple containing lists of issues detected by each detector.
+    :param keep_nodes: Whether issues reference the AST node they were found at.
+    :return: Tuple containing lists of loop, nested-if and if-chain issues.
+    :raises FileNotFoundError: If the file does not exist.
+    :raises SyntaxError: If the code contains syntax errors.
     """
-    try:
-        code = read_python_file(file_path)
-        tree = generate_ast(code)
-    except Exception as e:
-        print(f"Error processing {file_path}: {e}")
-        return [], [], []
+    code = read_python_file(file_path)
+    return analyze_source(code, keep_nodes)
 
-    # Initializes detectors
-    loop_detector = ForLoopDetector()
-    nested_if_detector = NestedIfDetector()
-    if_chain_detector = IfElseChainDetector()
+def analyze_file_flat(file_path: str) -> Tuple[array.array, List[str]]:
+    """
+    Analyzes a Python file, returning its issues as flat, parallel sequences.
 
-    # Visits the AST
-    loop_detector.visit(tree)
-    nested_if_detector.visit(tree)
-    if_chain_detector.visit(tree)
+    Issues are in source order. kinds[i] is the KIND_* constant of the i-th
+    issue and messages[i] its message. The detector appends to these directly,
+    so no Issue is built per entry.
 
-    return (
-        loop_detector.issues,
-        nested_if_detector.issues,
-        if_chain_detector.issues
-    )
\ No newline at end of file
+    :param file_path: Path to the Python file.
+    :return: Tuple of the issue kinds, as a signed char array, and their messages.
+    :raises FileNotFoundError: If the file does not exist.
+    :raises SyntaxError: If the code contains syntax errors.
+    """
+    tree = generate_ast(read_python_file(file_path))
+    detector = _thread_detector()
+    detector.reset(flat=True)
+    detector.detect(tree)
+    return detector.kinds, detector.messages
@@ -1,9 +1,13 @@
 import ast
 import logging
+from typing import Any, Callable, List, Optional, Tuple
 
 # Configures logging for refactoring actions
 logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
 
+# Marks the else branch of an if chain; unlike a string it can never equal a compared constant
+_ELSE = object()
+
 def transform_loop_to_comprehension(for_node: ast.For) -> ast.AST:
     """
     Transforms a for-loop that appends elements to a list into a list comprehension assignment.
@@ -67,7 +71,7 @@ def transform_loop_to_comprehension(for_node: ast.For) -> ast.AST:
     ast.fix_missing_locations(assign_node)
     return assign_node
 
-def transform_nested_if(if_node: ast.If) -> ast.AST:
+def transform_nested_if(if_node: ast.If) -> ast.If:
     """
     Transforms nested if-statements into a single if-statement with a combined condition.
 
@@ -89,7 +93,7 @@ def transform_nested_if(if_node: ast.If) -> ast.AST:
     :param if_node: The AST If node at the top level.
     :type if_node: ast.If
     :return: An AST node representing the transformed if-statement.
-    :rtype: ast.AST
+    :rtype: ast.If
     :raises ValueError: If the pattern does not match a nested if scenario.
     """
     if len(if_node.body) != 1 or not isinstance(if_node.body[0], ast.If):
@@ -111,7 +115,7 @@ def transform_nested_if(if_node: ast.If) -> ast.AST:
     ast.fix_missing_locations(new_if)
     return new_if
 
-def transform_if_chain_to_dict(if_node: ast.If) -> ast.AST:
+def transform_if_chain_to_dict(if_node: ast.If) -> List[ast.stmt]:
     """
     Transforms an if-elif-else chain checking equality against a single variable into a dictionary lookup.
 
@@ -146,9 +150,10 @@ def transform_if_chain_to_dict(if_node: ast.If) -> ast.AST:
     :raises ValueError: If the chain does not match the expected pattern.
     """
     # Gathers conditions and bodies
-    chain = []
-    current = if_node
-    variable_name = None
+    chain: List[Tuple[Any, List[ast.stmt]]] = []
+    current: Optional[ast.If] = if_node
+    # Identifiers are never empty, so an empty name marks the first condition
+    variable_name = ''
 
     while current:
         # Checks if condition is binary op of form: var == constant
@@ -159,7 +164,7 @@ def transform_if_chain_to_dict(if_node: ast.If) -> ast.AST:
             raise ValueError("If chain conditions must be equality checks.")
 
         left = current.test.left
-        if variable_name is None:
+        if not variable_name:
             if not isinstance(left, ast.Name):
                 raise ValueError("If chain conditions must compare a variable to a constant.")
             variable_name = left.id
@@ -187,7 +192,7 @@ def transform_if_chain_to_dict(if_node: ast.If) -> ast.AST:
             # no more elifs
             else_body = current.orelse
             if else_body:
-                chain.append(('__else__', else_body))
+                chain.append((_ELSE, else_body))
             current = None
 
     # Constructs the actions dictionary
@@ -196,31 +201,15 @@ def transform_if_chain_to_dict(if_node: ast.If) -> ast.AST:
     #   2: lambda: action_two(),
     #   ...
     # }
-    dict_keys = []
-    dict_values = []
-    default_body = None
-
-    for (cond_val, body) in chain:
-        if cond_val == '__else__':
-            # This is the default action
-            default_body = body
-        else:
-            # Wraps each body in a lambda: lambda: <body>
-            # Body is a list of statements
-            lambda_func = ast.Lambda(
-                args=ast.arguments(
-                    posonlyargs=[],
-                    args=[],
-                    kwonlyargs=[],
-                    kw_defaults=[],
-                    defaults=[]
-                ),
-                body=wrap_body_in_expression(body)
-            )
-            dict_keys.append(ast.Constant(value=cond_val))
-            dict_values.append(lambda_func)
-
-    actions_dict = ast.Dict(keys=dict_keys, values=dict_values)
+    # The else branch, if any, is always the last entry of the chain
+    default_body = chain.pop()[1] if chain[-1][0] is _ELSE else None
+
+    # Wraps each body in a lambda: lambda: <body>
+    dict_keys, dict_values = zip(*[
+        (ast.Constant(value=cond_val), _lambda(body)) for cond_val, body in chain
+    ])
+
+    actions_dict = ast.Dict(keys=list(dict_keys), values=list(dict_values))
 
     # Assigns to a variable:
     # actions = {...}
@@ -231,16 +220,7 @@ def transform_if_chain_to_dict(if_node: ast.If) -> ast.AST:
 
     # Builds call: actions.get(x, lambda: default_action())()
     if default_body:
-        default_lambda = ast.Lambda(
-            args=ast.arguments(
-                posonlyargs=[],
-                args=[],
-                kwonlyargs=[],
-                kw_defaults=[],
-                defaults=[]
-            ),
-            body=wrap_body_in_expression(default_body)
-        )
+        default_lambda = _lambda(default_body)
         get_call = ast.Call(
             func=ast.Attribute(
                 value=ast.Name(id="actions", ctx=ast.Load()),
@@ -275,6 +255,26 @@ def transform_if_chain_to_dict(if_node: ast.If) -> ast.AST:
 
     return [actions_assign, final_expr]
 
+def _lambda(body: List[ast.stmt]) -> ast.Lambda:
+    """
+    Builds an argument-less lambda whose result is the given body wrapped as an expression.
+
+    :param body: List of AST statements.
+    :type body: list[ast.stmt]
+    :return: The lambda node.
+    :rtype: ast.Lambda
+    """
+    return ast.Lambda(
+        args=ast.arguments(
+            posonlyargs=[],
+            args=[],
+            kwonlyargs=[],
+            kw_defaults=[],
+            defaults=[]
+        ),
+        body=wrap_body_in_expression(body)
+    )
+
 def wrap_body_in_expression(body):
     """
     Wraps a body (list of statements) into a single expression node if possible.
@@ -295,6 +295,65 @@ def wrap_body_in_expression(body):
     # Otherwise, returns a Constant(None)
     return ast.Constant(value=None)
 
+def log_skipped_refactoring(node: ast.AST, error: ValueError):
+    """
+    Logs that a node was left as-is because it does not match a refactoring pattern.
+
+    :param node: The node that could not be refactored.
+    :type node: ast.AST
+    :param error: The error raised by the transformation.
+    :type error: ValueError
+    """
+    lineno = getattr(node, 'lineno', 'unknown')
+    logging.warning(f"Skipped refactoring at line {lineno}: {error}")
+
+class FusedRefactorer(ast.NodeTransformer):
+    """
+    Walks an AST once, bottom-up, applying every refactoring to each loop and if-statement.
+
+    The transformations are called directly rather than through the engine's
+    per-pattern methods, so each candidate node costs one call and one try block.
+    """
+
+    def __init__(self) -> None:
+        # Whether any node has been replaced so far
+        self.changed = False
+
+    def _try(self, transform: Callable[[Any], Any], node: ast.AST) -> Any:
+        """
+        Applies a transformation to a node, logging and returning None if the pattern does not match.
+
+        :param transform: One of the transform_* functions.
+        :type transform: Callable[[ast.AST], Any]
+        :param node: The node to transform.
+        :type node: ast.AST
+        :return: The transformed node(s), or None if the node does not match.
+        """
+        try:
+            return transform(node)
+        except ValueError as e:
+            log_skipped_refactoring(node, e)
+            return None
+
+    def visit_For(self, node: ast.For) -> ast.AST:
+        self.generic_visit(node)
+        new_node = self._try(transform_loop_to_comprehension, node)
+        if new_node is None:
+            return node
+        self.changed = True
+        return new_node
+
+    def visit_If(self, node: ast.If) -> ast.AST:
+        self.generic_visit(node)
+        new_node = self._try(transform_nested_if, node)
+        if new_node is not None:
+            self.changed = True
+            node = new_node
+        # A matching chain becomes two statements, which cannot replace the single
+        # if-node in place, so the chain is only checked and the node kept either way
+        self._try(transform_if_chain_to_dict, node)
+        return node
+
 class RefactoringEngine:
     """
     The RefactoringEngine class applies various code transformations to an AST.
@@ -309,6 +368,23 @@ class RefactoringEngine:
     it will log a warning and leave the code as-is.
     """
 
+    def apply(self, tree: ast.AST) -> Tuple[ast.AST, bool]:
+        """
+        Applies every refactoring to a parsed tree in a single traversal.
+
+        The tree is transformed in place, so callers that already hold a parsed
+        tree (for example from pattern detection) can pass it on without re-parsing.
+
+        :param tree: The AST of the code.
+        :type tree: ast.AST
+        :return: The transformed AST, and whether any transformation was applied.
+        :rtype: Tuple[ast.AST, bool]
+        """
+        visitor = FusedRefactorer()
+        transformed_tree = visitor.visit(tree)
+        ast.fix_missing_locations(transformed_tree)
+        return transformed_tree, visitor.changed
+
     def refactor_loop(self, for_node: ast.For) -> ast.AST:
         """
         Attempts to refactor a given for-loop node into a list comprehension if it matches the known pattern.
@@ -322,8 +398,7 @@ class RefactoringEngine:
             return transform_loop_to_comprehension(for_node)
         except ValueError as e:
             # Logs a warning and returns the original node
-            lineno = getattr(for_node, 'lineno', 'unknown')
-            logging.warning(f"Skipped refactoring at line {lineno}: {e}")
+            log_skipped_refactoring(for_node, e)
             return for_node
 
     def refactor_nested_if(self, if_node: ast.If) -> ast.AST:
@@ -338,8 +413,7 @@ class RefactoringEngine:
         try:
             return transform_nested_if(if_node)
         except ValueError as e:
-            lineno = getattr(if_node, 'lineno', 'unknown')
-            logging.warning(f"Skipped refactoring at line {lineno}: {e}")
+            log_skipped_refactoring(if_node, e)
             return if_node
 
     def refactor_if_chain(self, if_node: ast.If) -> list[ast.stmt]:
@@ -354,7 +428,6 @@ class RefactoringEngine:
         try:
             return transform_if_chain_to_dict(if_node)
         except ValueError as e:
-            lineno = getattr(if_node, 'lineno', 'unknown')
-            logging.warning(f"Skipped refactoring at line {lineno}: {e}")
+            log_skipped_refactoring(if_node, e)
             # Returns the original node as a list to maintain consistency
             return [if_node]
\ No newline at end of file
@@ -0,0 +1,62 @@
+import os
+from typing import List, NamedTuple
+
+import pytest
+
+from refactoring_tool.code_parser import Issue, analyze_file
+from refactoring_tool.refactoring_engine import RefactoringEngine
+
+SAMPLE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sample_code')
+SAMPLE_FILES = ('sample_loop.py', 'sample_nested_if.py', 'sample_if_chain.py', 'sample_no_issues.py')
+
+class ParsedSample(NamedTuple):
+    """
+    The issues found in one sample file, by pattern.
+    """
+    loops: List[Issue]
+    nested: List[Issue]
+    chains: List[Issue]
+
+@pytest.fixture(scope="session")
+def sample_code_dir():
+    """
+    Fixture to provide the path to the sample code directory.
+
+    :return: Path to the sample code directory.
+    """
+    return SAMPLE_DIR
+
+@pytest.fixture(scope="session")
+def parsed_samples(sample_code_dir):
+    """
+    Fixture to analyze every sample file once per test session.
+
+    :param sample_code_dir: Fixture providing the sample code directory path.
+    :return: The issues of each sample, keyed by file name.
+    """
+    return {name: ParsedSample(*analyze_file(os.path.join(sample_code_dir, name))) for name in SAMPLE_FILES}
+
+@pytest.fixture(scope="session")
+def faulty_file(tmp_path_factory):
+    """
+    Fixture to write a file with a syntax error once per test session.
+
+    Tests must not modify the file, as they all share it.
+
+    :param tmp_path_factory: Fixture creating session-wide temporary directories.
+    :return: Path to the faulty file.
+    """
+    file_path = tmp_path_factory.mktemp("fault") / "faulty.py"
+    file_path.write_text("def faulty_function(:\n    pass")
+    return file_path
+
+@pytest.fixture(scope="session")
+def engine():
+    """
+    Fixture to provide a RefactoringEngine shared across the test session.
+
+    The engine keeps no state between calls, so tests can share it.
+
+    :return: A RefactoringEngine instance.
+    """
+    return RefactoringEngine()
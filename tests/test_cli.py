@@ -3,6 +3,10 @@ import shutil
 import pytest
 import subprocess
 
+_SAMPLE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sample_code")
+_LOOP_PATH = os.path.join(_SAMPLE_DIR, "sample_loop.py")
+_IF_CHAIN_PATH = os.path.join(_SAMPLE_DIR, "sample_if_chain.py")
+
 @pytest.fixture
 def temp_output_dir(tmp_path):
     """
@@ -17,7 +21,7 @@ def test_cli_on_sample_file(temp_output_dir):
     Tests the CLI on a sample Python file, verifying that
     a refactored output file is created.
     """
-    sample_file = os.path.join(os.path.dirname(__file__), "sample_code", "sample_loop.py")
+    sample_file = _LOOP_PATH
     cmd = [
         "python", 
         "-m", 
@@ -40,7 +44,7 @@ def test_cli_on_directory(temp_output_dir):
     """
     Tests the CLI on a directory containing multiple Python files.
     """
-    sample_dir = os.path.join(os.path.dirname(__file__), "sample_code")
+    sample_dir = _SAMPLE_DIR
     cmd = [
         "python", 
         "-m", 
@@ -58,6 +62,48 @@ def test_cli_on_directory(temp_output_dir):
     for f in expected_files:
         assert os.path.exists(os.path.join(temp_output_dir, f)), f"{f} should be refactored."
 
+def test_cli_on_directory_single_job(temp_output_dir):
+    """
+    Tests the CLI on a directory when worker processes are disabled.
+    """
+    sample_dir = _SAMPLE_DIR
+    cmd = [
+        "python",
+        "-m",
+        "refactoring_tool.cli",
+        sample_dir,
+        "--output",
+        temp_output_dir,
+        "--jobs",
+        "1"
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    assert result.returncode == 0, f"CLI returned error: {result.stderr}"
+
+    expected_files = ["sample_loop.py", "sample_nested_if.py", "sample_if_chain.py", "sample_no_issues.py"]
+    for f in expected_files:
+        assert os.path.exists(os.path.join(temp_output_dir, f)), f"{f} should be refactored."
+
+def test_cli_keeps_file_without_applicable_refactoring(temp_output_dir):
+    """
+    Tests that a file whose issues cannot be refactored is copied unchanged.
+    """
+    sample_file = _IF_CHAIN_PATH
+    cmd = [
+        "python",
+        "-m",
+        "refactoring_tool.cli",
+        sample_file,
+        "--output",
+        temp_output_dir
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    assert result.returncode == 0, f"CLI returned error: {result.stderr}"
+
+    with open(sample_file, 'rb') as original, \
+         open(os.path.join(temp_output_dir, "sample_if_chain.py"), 'rb') as output:
+        assert output.read() == original.read(), "Output should match the original file."
+
 def test_cli_nonexistent_file(temp_output_dir):
     """
     Tests how the CLI handles a non-existent input path.
@@ -73,4 +119,24 @@ def test_cli_nonexistent_file(temp_output_dir):
     result = subprocess.run(cmd, capture_output=True, text=True)
     # The CLI should exit with code 1
     assert result.returncode == 1, "Should exit with code 1 for non-existent file."
-    assert "not a valid file or directory" in result.stdout
\ No newline at end of file
+    assert "not a valid file or directory" in result.stdout
+
+def test_cli_rejects_non_positive_jobs(temp_output_dir):
+    """
+    Tests that the CLI rejects a worker count below 1 with a usage error.
+    """
+    cmd = [
+        "python",
+        "-m",
+        "refactoring_tool.cli",
+        _SAMPLE_DIR,
+        "--output",
+        temp_output_dir,
+        "-j",
+        "0"
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    # argparse exits with code 2 on invalid arguments
+    assert result.returncode == 2, "Should exit with code 2 for -j 0."
+    assert "must be at least 1" in result.stderr
+    assert "Traceback" not in result.stderr
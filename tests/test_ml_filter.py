@@ -1,8 +1,11 @@
 import pytest
 import os
+import numpy as np
 import pandas as pd
 import tempfile
+from sklearn.ensemble import HistGradientBoostingClassifier
 
+from refactoring_tool import ml_filter as ml_filter_module
 from refactoring_tool.ml_filter import MLErrorFilter
 
 def test_feature_extraction():
@@ -47,4 +50,59 @@ def test_train_and_predict():
         if os.path.exists(tmp_name):
             os.remove(tmp_name)
         if os.path.exists("test_model.pkl"):
-            os.remove("test_model.pkl")
\ No newline at end of file
+            os.remove("test_model.pkl")
+
+def test_feature_cache_reuses_rows(tmp_path, monkeypatch):
+    """
+    Tests that cached feature rows are returned on a second extraction without recomputing them.
+
+    :param tmp_path: Fixture providing a temporary cache directory.
+    :param monkeypatch: Fixture for making feature computation fail once rows are cached.
+    """
+    pairs = [("x = 1\n", "x = 2\n"), ("if a:\n    b()\n", "b()\n")]
+    first = MLErrorFilter(cache_dir=str(tmp_path)).extract_feature_matrix(pairs)
+    assert (first == MLErrorFilter().extract_feature_matrix(pairs)).all()
+
+    def fail(code_before, code_after):
+        raise AssertionError("Cached rows should not be recomputed.")
+
+    monkeypatch.setattr(ml_filter_module, "_feature_values", fail)
+    second = MLErrorFilter(cache_dir=str(tmp_path)).extract_feature_matrix(pairs)
+    assert (second == first).all()
+
+    # A new pair is computed on its own, without recomputing the cached ones
+    monkeypatch.setattr(ml_filter_module, "_feature_values", lambda before, after: (1.0,) * 10)
+    third = MLErrorFilter(cache_dir=str(tmp_path)).extract_feature_matrix(pairs + [("y = 1\n", "y = 2\n")])
+    assert (third[:2] == first).all()
+    assert (third[2] == 1.0).all()
+
+def test_feature_cache_ignores_other_versions(tmp_path, monkeypatch):
+    """
+    Tests that rows cached under another FEATURE_VERSION are not reused.
+
+    :param tmp_path: Fixture providing a temporary cache directory.
+    :param monkeypatch: Fixture for changing the feature version and computation.
+    """
+    pairs = [("x = 1\n", "x = 2\n")]
+    MLErrorFilter(cache_dir=str(tmp_path)).extract_feature_matrix(pairs)
+
+    monkeypatch.setattr(ml_filter_module, "FEATURE_VERSION", ml_filter_module.FEATURE_VERSION + 1)
+    monkeypatch.setattr(ml_filter_module, "_feature_values", lambda before, after: (99.0,) * 10)
+    rows = MLErrorFilter(cache_dir=str(tmp_path)).extract_feature_matrix(pairs)
+    assert (rows == 99.0).all(), "Rows should be recomputed for a new feature version."
+
+def test_batch_prediction_matches_single():
+    """
+    Tests that batch prediction agrees with predicting each pair on its own.
+    """
+    ml_filter = MLErrorFilter()
+    rng = np.random.RandomState(0)
+    ml_filter.model = HistGradientBoostingClassifier(max_iter=5, random_state=0).fit(
+        rng.rand(20, len(ml_filter.feature_names)), rng.randint(0, 2, 20)
+    )
+
+    pairs = [("x = 1\n", "x = 2\n"), ("if a:\n    b()\n", "b()\n")]
+    probs = ml_filter.predict_refactoring_errors(pairs)
+    assert probs.shape == (2,)
+    for prob, (code_before, code_after) in zip(probs, pairs):
+        assert prob == ml_filter.predict_refactoring_error(code_before, code_after)
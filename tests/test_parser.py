@@ -1,80 +1,256 @@
+import ast
 import pytest
 import os
-from refactoring_tool.code_parser import analyze_file
+import sys
+from refactoring_tool import code_parser
+from refactoring_tool.code_parser import (
+    KIND_FOR_LOOP,
+    KIND_IF_CHAIN,
+    KIND_NESTED_IF,
+    analyze_file,
+    analyze_file_flat,
+    analyze_source,
+    decode_python_source,
+    load_or_generate_ast,
+    prune_ast_cache
+)
 
-@pytest.fixture
-def sample_code_dir():
+_FAULTY_SRC = "def faulty_function(:\n    pass"
+
+# Interned like the parser's messages, so matching issues compare by identity first
+_LOOP_MSG = sys.intern("For-loop can be converted to a list comprehension.")
+_NESTED_IF_MSG = sys.intern("Nested if-statements can be merged.")
+_IF_CHAIN_MSG = sys.intern("If-elif-else chain can be replaced with a dictionary.")
+
+@pytest.mark.parametrize("file_name,kind,message", [
+    ('sample_loop.py', 'loops', _LOOP_MSG),
+    ('sample_nested_if.py', 'nested', _NESTED_IF_MSG),
+    ('sample_if_chain.py', 'chains', _IF_CHAIN_MSG),
+    ('sample_no_issues.py', None, None),
+])
+def test_sample_detection(parsed_samples, file_name, kind, message):
     """
-    Fixture to provide the path to the sample code directory.
+    Tests if the parser correctly identifies inefficient loops, nested if-statements and
+    if-elif-else chains, and reports nothing for code with no issues.
 
-    :return: Path to the sample code directory.
+    :param parsed_samples: Fixture providing the analyzed sample files.
+    :param file_name: The sample file to check.
+    :param kind: The ParsedSample field expected to hold the single issue, or None for no issues.
+    :param message: The message expected on the issue.
     """
-    return os.path.join(os.path.dirname(__file__), 'sample_code')
+    sample = parsed_samples[file_name]
+
+    if kind is None:
+        assert sum(map(len, sample)) == 0, "Should detect no issues."
+        return
+
+    issues = getattr(sample, kind)
+    assert len(issues) == 1, f"Should detect one issue in {file_name}."
+    assert issues[0].message is message or message in issues[0].message
 
-def test_loop_detection(sample_code_dir):
+@pytest.mark.parametrize("file_name,kind,message", [
+    ('sample_loop.py', KIND_FOR_LOOP, _LOOP_MSG),
+    ('sample_nested_if.py', KIND_NESTED_IF, _NESTED_IF_MSG),
+    ('sample_if_chain.py', KIND_IF_CHAIN, _IF_CHAIN_MSG),
+])
+def test_flat_detection(sample_code_dir, file_name, kind, message):
     """
-    Tests if the parser correctly identifies inefficient loops.
+    Tests if analyze_file_flat reports each sample's single issue with its kind.
+
+    :param sample_code_dir: Fixture providing the sample code directory path.
+    :param file_name: The sample file to check.
+    :param kind: The KIND_* constant expected for the issue.
+    :param message: The message expected on the issue.
+    """
+    kinds, messages = analyze_file_flat(os.path.join(sample_code_dir, file_name))
+
+    assert kinds.tolist() == [kind], f"Should detect one issue in {file_name}."
+    assert messages[0] is message or message in messages[0]
+
+def test_flat_detection_builds_no_issues(tmp_path, monkeypatch):
+    """
+    Tests if analyze_file_flat reports issues in source order without building Issue objects.
+
+    :param tmp_path: Fixture providing a temporary directory.
+    :param monkeypatch: Fixture for making Issue construction fail.
+    """
+    file_path = tmp_path / "mixed.py"
+    file_path.write_text(
+        "if a:\n    if b:\n        do()\n"
+        "result = []\nfor i in items:\n    result.append(i)\n"
+    )
+
+    def fail(*args, **kwargs):
+        raise AssertionError("No Issue should be built.")
+
+    monkeypatch.setattr(code_parser, "Issue", fail)
+    kinds, messages = analyze_file_flat(str(file_path))
+
+    assert kinds.tolist() == [KIND_NESTED_IF, KIND_FOR_LOOP]
+    assert messages == [_NESTED_IF_MSG, _LOOP_MSG]
+
+def test_long_if_chain_reported_once(tmp_path):
+    """
+    Tests if a long if-elif-else chain is reported once, at its head.
+
+    :param tmp_path: Fixture providing a temporary directory.
+    """
+    branches = "\n".join(f"elif x == {i}:\n    print({i})" for i in range(1, 8))
+    file_path = tmp_path / "long_chain.py"
+    file_path.write_text(f"x = 3\nif x == 0:\n    print(0)\n{branches}\n")
+
+    _, _, if_chain_issues = analyze_file(str(file_path))
+
+    assert len(if_chain_issues) == 1, "Should detect the chain only once."
+    assert if_chain_issues[0].line == 2
+
+def test_deeply_nested_if_reported_once(tmp_path):
+    """
+    Tests if a stack of nested if-statements is reported once, at the outermost if.
+
+    :param tmp_path: Fixture providing a temporary directory.
+    """
+    file_path = tmp_path / "deep_if.py"
+    file_path.write_text("if a:\n    if b:\n        if c:\n            do()\n")
+
+    _, nested_if_issues, _ = analyze_file(str(file_path))
+
+    assert len(nested_if_issues) == 1, "Should detect the nested ifs only once."
+    assert nested_if_issues[0].line == 1
+
+def test_issues_reported_in_source_order(tmp_path):
+    """
+    Tests if issues in if/else and try/except branches are reported in source order.
+
+    :param tmp_path: Fixture providing a temporary directory.
+    """
+    loop = "    result = []\n    for i in items:\n        result.append(i)\n"
+    file_path = tmp_path / "branches.py"
+    file_path.write_text(f"if flag:\n{loop}else:\n{loop}try:\n{loop}except ValueError:\n{loop}")
+
+    loop_issues, _, _ = analyze_file(str(file_path))
+
+    assert [issue.line for issue in loop_issues] == [3, 7, 11, 15]
+
+def test_issue_nodes_kept_on_request(sample_code_dir):
+    """
+    Tests that issues only reference their AST node when asked to.
 
     :param sample_code_dir: Fixture providing the sample code directory path.
     """
     file_path = os.path.join(sample_code_dir, 'sample_loop.py')
+
     loop_issues, _, _ = analyze_file(file_path)
+    assert loop_issues[0].node is None
 
-    assert len(loop_issues) == 1, "Should detect one inefficient loop."
-    issue = loop_issues[0]
-    assert "For-loop can be converted to a list comprehension." in issue['message']
+    loop_issues, _, _ = analyze_file(file_path, keep_nodes=True)
+    assert isinstance(loop_issues[0].node, ast.For)
 
-def test_nested_if_detection(sample_code_dir):
+def test_ast_cache_reuses_tree(tmp_path):
     """
-    Tests if the parser correctly identifies nested if-statements.
+    Tests that the on-disk AST cache stores a tree and returns it on later calls.
 
-    :param sample_code_dir: Fixture providing the sample code directory path.
+    :param tmp_path: Fixture providing a temporary directory.
     """
-    file_path = os.path.join(sample_code_dir, 'sample_nested_if.py')
-    _, nested_if_issues, _ = analyze_file(file_path)
+    code = b"result = []\nfor i in range(3):\n    result.append(i)\n"
+    cache_dir = str(tmp_path / "cache")
+
+    first = load_or_generate_ast(code, cache_dir)
+    cached_files = [f for _, _, files in os.walk(cache_dir) for f in files]
+    assert len(cached_files) == 1, "The tree should be stored in the cache."
+
+    second = load_or_generate_ast(code, cache_dir)
+    assert second is not first
+    assert ast.dump(second) == ast.dump(first)
 
-    assert len(nested_if_issues) == 1, "Should detect one nested if-statement."
-    issue = nested_if_issues[0]
-    assert "Nested if-statements can be merged." in issue['message']
+    prune_ast_cache(cache_dir, max_bytes=0)
+    assert not [f for _, _, files in os.walk(cache_dir) for f in files], "Pruning should empty the cache."
 
-def test_if_chain_detection(sample_code_dir):
+def test_ast_cache_prune_keeps_other_files(tmp_path):
     """
-    Tests if the parser correctly identifies if-elif-else chains.
+    Tests that pruning the AST cache only removes the trees it stored.
 
-    :param sample_code_dir: Fixture providing the sample code directory path.
+    :param tmp_path: Fixture providing a temporary directory.
     """
-    file_path = os.path.join(sample_code_dir, 'sample_if_chain.py')
-    _, _, if_chain_issues = analyze_file(file_path)
+    cache_dir = tmp_path / "cache"
+    load_or_generate_ast(b"value = 1\n", str(cache_dir))
+    (cache_dir / "other").mkdir()
+    (cache_dir / "other" / "notes.txt").write_text("keep")
+    (cache_dir / "README").write_text("keep")
 
-    assert len(if_chain_issues) == 1, "Should detect one if-elif-else chain."
-    issue = if_chain_issues[0]
-    assert "If-elif-else chain can be replaced with a dictionary." in issue['message']
+    prune_ast_cache(str(cache_dir), max_bytes=0)
 
-def test_no_issues(sample_code_dir):
+    remaining = sorted(f for _, _, files in os.walk(cache_dir) for f in files)
+    assert remaining == ["README", "notes.txt"], "Only cached trees should be removed."
+
+def test_ast_cache_read_only_entry_reused(tmp_path, monkeypatch):
     """
-    Tests if the parser correctly handles code with no issues.
+    Tests that a cached tree is still returned when its access time cannot be updated.
 
-    :param sample_code_dir: Fixture providing the sample code directory path.
+    :param tmp_path: Fixture providing a temporary directory.
+    :param monkeypatch: Fixture for patching the failing os.utime.
     """
-    file_path = os.path.join(sample_code_dir, 'sample_no_issues.py')
-    loop_issues, nested_if_issues, if_chain_issues = analyze_file(file_path)
+    code = b"value = 1\n"
+    cache_dir = str(tmp_path / "cache")
+    load_or_generate_ast(code, cache_dir)
+
+    def fail(*args, **kwargs):
+        raise OSError("Read-only file system")
 
-    total_issues = len(loop_issues) + len(nested_if_issues) + len(if_chain_issues)
-    assert total_issues == 0, "Should detect no issues."
+    monkeypatch.setattr(code_parser.os, "utime", fail)
+    monkeypatch.setattr(code_parser, "generate_ast", fail)
+    tree = load_or_generate_ast(code, cache_dir)
+    assert isinstance(tree, ast.Module), "The cached tree should be loaded without parsing."
 
-def test_syntax_error_handling(tmp_path):
+def test_ast_cache_store_failure_returns_tree(tmp_path, monkeypatch):
     """
-    Tests if the parser handles syntax errors gracefully.
+    Tests that a tree which cannot be stored in the cache is still returned, leaving no temporary file.
 
     :param tmp_path: Fixture providing a temporary directory.
+    :param monkeypatch: Fixture for patching the failing pickle.dump.
+    """
+    def fail(*args, **kwargs):
+        raise RecursionError("maximum recursion depth exceeded")
+
+    monkeypatch.setattr(code_parser.pickle, "dump", fail)
+    cache_dir = tmp_path / "cache"
+    tree = load_or_generate_ast(b"value = 1\n", str(cache_dir))
+
+    assert isinstance(tree, ast.Module), "The parsed tree should be returned."
+    assert not [f for _, _, files in os.walk(cache_dir) for f in files], "No cache file should be left."
+
+def test_syntax_error_handling(faulty_file):
     """
-    code_with_error = "def faulty_function(:\n    pass"
+    Tests if the parser handles syntax errors gracefully.
 
-    file_path = tmp_path / "faulty.py"
-    file_path.write_text(code_with_error)
+    :param faulty_file: Fixture providing a file with a syntax error.
+    """
+    # A plain try/except skips building pytest's ExceptionInfo for the long parser traceback
+    try:
+        analyze_file(str(faulty_file))
+    except SyntaxError:
+        return
+    pytest.fail("Expected SyntaxError")
+
+def test_source_syntax_error_handling():
+    """
+    Tests if analyzing source code with a syntax error raises SyntaxError.
+    """
+    try:
+        analyze_source(_FAULTY_SRC)
+    except SyntaxError:
+        return
+    pytest.fail("Expected SyntaxError")
+
+def test_analyze_source_honors_encoding():
+    """
+    Tests if source bytes are analyzed and decoded following their encoding declaration.
+    """
+    code = "# -*- coding: latin-1 -*-\nresult = []\nfor c in 'caf\u00e9':\n    result.append(c)\n".encode('latin-1')
 
-    with pytest.raises(SyntaxError):
-        analyze_file(str(file_path))
+    loop_issues, _, _ = analyze_source(code)
+    assert [issue.line for issue in loop_issues] == [3]
+    assert "'caf\u00e9'" in decode_python_source(code)
 
 def test_file_not_found():
     """
@@ -82,5 +258,8 @@ def test_file_not_found():
     """
     file_path = "non_existent_file.py"
 
-    with pytest.raises(FileNotFoundError):
-        analyze_file(file_path)
\ No newline at end of file
+    try:
+        analyze_file(file_path)
+    except FileNotFoundError:
+        return
+    pytest.fail("Expected FileNotFoundError")
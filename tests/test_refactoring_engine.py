@@ -1,5 +1,13 @@
+"""
+Tests for refactoring_engine.py.
+
+PYTEST_DONT_REWRITE: the assertions run as plain asserts, so failures only
+report their message.
+"""
 import ast
+import copy
 import pytest
+from typing import Dict
 
 from refactoring_tool.refactoring_engine import (
     transform_loop_to_comprehension,
@@ -8,61 +16,25 @@ from refactoring_tool.refactoring_engine import (
     RefactoringEngine
 )
 
-def test_transform_loop_to_comprehension_valid():
-    """
-    Tests that a valid loop is converted into a list comprehension.
-    """
-    code_before = """
+_LOOP_SRC = """
 result = []
 for i in range(5):
     result.append(i * 2)
 """
-    tree = ast.parse(code_before)
-    for_node = tree.body[1]  # The 'for' node
 
-    new_node = transform_loop_to_comprehension(for_node)
-    assert isinstance(new_node, ast.Assign), "Should return an Assign node."
-    # Check that the Assign node has a ListComp
-    assert isinstance(new_node.value, ast.ListComp), "Should transform to a ListComp."
-
-def test_transform_loop_to_comprehension_invalid():
-    """
-    Tests that an invalid loop raises ValueError.
-    """
-    code_before = """
+_INVALID_LOOP_SRC = """
 result = []
 for i in range(5):
     print(i)
 """
-    tree = ast.parse(code_before)
-    for_node = tree.body[1]
-
-    with pytest.raises(ValueError):
-        transform_loop_to_comprehension(for_node)
 
-def test_transform_nested_if_valid():
-    """
-    Tests merging nested if-statements into a single condition.
-    """
-    code_before = """
+_NESTED_IF_SRC = """
 if condition_a:
     if condition_b:
         do_something()
 """
-    tree = ast.parse(code_before)
-    if_node = tree.body[0]
-
-    new_if = transform_nested_if(if_node)
-    assert isinstance(new_if, ast.If), "Should return an If node."
-    # Check that the test is a BoolOp with an And
-    assert isinstance(new_if.test, ast.BoolOp), "Condition should be BoolOp."
-    assert isinstance(new_if.test.op, ast.And), "BoolOp should be 'and'."
 
-def test_transform_if_chain_to_dict_valid():
-    """
-    Tests converting if-elif-else chain to a dictionary lookup.
-    """
-    code_before = """
+_IF_CHAIN_SRC = """
 if x == 1:
     action_one()
 elif x == 2:
@@ -70,20 +42,8 @@ elif x == 2:
 else:
     default_action()
 """
-    tree = ast.parse(code_before)
-    if_node = tree.body[0]
-
-    result_nodes = transform_if_chain_to_dict(if_node)
-    # Should return a list of two statements: Assign (actions dict) and Expr (call).
-    assert len(result_nodes) == 2, "Should produce two statements (dict and call)."
-
-def test_refactoring_engine_integration():
-    """
-    Tests RefactoringEngine high-level methods (refactor_loop, refactor_nested_if, refactor_if_chain).
-    """
-    engine = RefactoringEngine()
 
-    code = """
+_INTEGRATION_SRC = """
 result = []
 for i in range(5):
     result.append(i)
@@ -97,17 +57,178 @@ elif x == 2:
 else:
     default_action()
 """
-    tree = ast.parse(code)
-
-    # Manually walks the tree and apply transformations
-    for node in tree.body:
-        if isinstance(node, ast.For):
-            new_node = engine.refactor_loop(node)
-            assert isinstance(new_node, ast.AST)
-
-        if isinstance(node, ast.If):
-            new_node = engine.refactor_nested_if(node)
-            if isinstance(new_node, ast.If):
-                chain_result = engine.refactor_if_chain(new_node)
-                # chain_result can be a list of statements or a single If node
-                assert isinstance(chain_result, list)
\ No newline at end of file
+
+_APPLY_SRC = """
+result = []
+for i in range(5):
+    result.append(i)
+if condition_a:
+    if condition_b:
+        nested_action()
+"""
+
+_NO_PATTERN_SRC = "value = compute()\n"
+
+def _first(tree: ast.Module, cls: type) -> ast.stmt:
+    """
+    Finds the first top-level statement of a given node type.
+
+    :param tree: The module to search.
+    :type tree: ast.Module
+    :param cls: The AST node class to look for.
+    :type cls: type
+    :return: The first statement of tree that is an instance of cls.
+    :rtype: ast.stmt
+    """
+    return next(node for node in tree.body if isinstance(node, cls))
+
+def _parse_snippets(snippets: Dict[str, str]) -> Dict[str, ast.Module]:
+    """
+    Parses every snippet in a single compile call and splits the result back per snippet.
+
+    The transform_* functions build new nodes rather than mutating their input,
+    so tests share these trees; tests that transform a tree in place must
+    deepcopy it first.
+
+    :param snippets: Snippet sources keyed by name, each ending in a newline.
+    :type snippets: Dict[str, str]
+    :return: The parsed statements of each snippet, as a module, keyed by name.
+    :rtype: Dict[str, ast.Module]
+    """
+    # Compiles straight to an AST, skipping the ast.parse wrapper, as code_parser.generate_ast does
+    tree = compile(''.join(snippets.values()), '<test>', 'exec', flags=ast.PyCF_ONLY_AST, dont_inherit=True)
+
+    # Assigns each top-level statement to the snippet whose lines it starts on
+    modules = {}
+    index = 0
+    end_line = 0
+    for name, src in snippets.items():
+        end_line += src.count('\n')
+        body = []
+        while index < len(tree.body) and tree.body[index].lineno <= end_line:
+            body.append(tree.body[index])
+            index += 1
+        modules[name] = ast.Module(body=body, type_ignores=[])
+    return modules
+
+_TREES = _parse_snippets({
+    'loop': _LOOP_SRC,
+    'invalid_loop': _INVALID_LOOP_SRC,
+    'nested_if': _NESTED_IF_SRC,
+    'if_chain': _IF_CHAIN_SRC,
+    'integration': _INTEGRATION_SRC,
+    'apply': _APPLY_SRC,
+    'no_pattern': _NO_PATTERN_SRC,
+})
+
+# The transform tests only need the statement they transform, so the rest of their trees is dropped
+_VALID_FOR = _first(_TREES.pop('loop'), ast.For)
+_INVALID_FOR = _first(_TREES.pop('invalid_loop'), ast.For)
+_NESTED_IF = _first(_TREES.pop('nested_if'), ast.If)
+_CHAIN_IF = _first(_TREES.pop('if_chain'), ast.If)
+
+def _is_mergeable_nested_if(node: ast.If) -> bool:
+    """
+    Checks if an if-statement is a plain nested if, without else branches, that the engine can merge.
+
+    :param node: AST If node.
+    :return: True if the if-statement only wraps another else-less if-statement.
+    """
+    return (
+        not node.orelse
+        and len(node.body) == 1
+        and isinstance(node.body[0], ast.If)
+        and not node.body[0].orelse
+    )
+
+class _EngineChecker(ast.NodeVisitor):
+    """
+    Runs the engine checks on each For and If statement, dispatched by node class.
+
+    For and If nodes are not descended into, so only the outermost statements are checked.
+
+    :param engine: The engine whose refactor_* methods are checked.
+    """
+
+    def __init__(self, engine: RefactoringEngine):
+        self.engine = engine
+
+    def visit_For(self, node: ast.For):
+        new_node = self.engine.refactor_loop(node)
+        assert isinstance(new_node, ast.AST)
+
+    def visit_If(self, node: ast.If):
+        # Ifs that cannot merge skip the nested-if call rather than having the engine reject them
+        if _is_mergeable_nested_if(node):
+            new_node = self.engine.refactor_nested_if(node)
+            assert isinstance(new_node, ast.If)
+        elif node.orelse:
+            chain_result = self.engine.refactor_if_chain(node)
+            # chain_result can be a list of statements or a single If node
+            assert isinstance(chain_result, list)
+
+def test_transform_loop_to_comprehension_valid():
+    """
+    Tests that a valid loop is converted into a list comprehension.
+    """
+    new_node = transform_loop_to_comprehension(_VALID_FOR)
+    assert isinstance(new_node, ast.Assign), "Should return an Assign node."
+    # Check that the Assign node has a ListComp
+    assert isinstance(new_node.value, ast.ListComp), "Should transform to a ListComp."
+
+def test_transform_loop_to_comprehension_invalid():
+    """
+    Tests that an invalid loop raises ValueError.
+    """
+    # A plain try/except skips building pytest's ExceptionInfo, as in the parser's error tests
+    try:
+        transform_loop_to_comprehension(_INVALID_FOR)
+    except ValueError as e:
+        assert "valid append call" in str(e), "Should reject the loop for its body."
+        return
+    pytest.fail("Expected ValueError")
+
+def test_transform_nested_if_valid():
+    """
+    Tests merging nested if-statements into a single condition.
+    """
+    new_if = transform_nested_if(_NESTED_IF)
+    assert isinstance(new_if, ast.If), "Should return an If node."
+    # Check that the test is a BoolOp with an And
+    assert isinstance(new_if.test, ast.BoolOp), "Condition should be BoolOp."
+    assert isinstance(new_if.test.op, ast.And), "BoolOp should be 'and'."
+
+def test_transform_if_chain_to_dict_valid():
+    """
+    Tests converting if-elif-else chain to a dictionary lookup.
+    """
+    result_nodes = transform_if_chain_to_dict(_CHAIN_IF)
+    # Should return a list of two statements: Assign (actions dict) and Expr (call).
+    assert len(result_nodes) == 2, "Should produce two statements (dict and call)."
+
+def test_refactoring_engine_integration(engine):
+    """
+    Tests RefactoringEngine high-level methods (refactor_loop, refactor_nested_if, refactor_if_chain).
+
+    :param engine: Fixture providing a RefactoringEngine.
+    """
+    tree = _TREES['integration']
+
+    # Walks the tree once, applying the transformation matching each statement
+    _EngineChecker(engine).visit(tree)
+
+def test_refactoring_engine_apply(engine):
+    """
+    Tests that RefactoringEngine.apply rewrites a whole tree in one pass and reports the change.
+
+    :param engine: Fixture providing a RefactoringEngine.
+    """
+    # apply transforms the tree in place, so it works on a copy of the cached tree
+    tree = copy.deepcopy(_TREES['apply'])
+    new_tree, changed = engine.apply(tree)
+    assert changed, "A loop and a nested if should have been refactored."
+    assert isinstance(new_tree.body[1], ast.Assign), "The loop should become a list comprehension."
+    assert isinstance(new_tree.body[2].test, ast.BoolOp), "The nested ifs should be merged."
+
+    _, changed = engine.apply(copy.deepcopy(_TREES['no_pattern']))
+    assert not changed, "Code without patterns should be left unchanged."